@@ -3,222 +3,369 @@ Database management for Personal Finance Application
 """
 
 import sqlite3
-import os
-from datetime import datetime
-from typing import Dict, List, Optional, Tuple, Any
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import date, datetime
+from typing import Dict, Iterator, List, Optional, Tuple, Union, Any
+
+SCHEMA_SQL = '''
+-- Connection tuning: WAL lets readers run alongside the writer and
+-- NORMAL sync is durable in WAL mode with far fewer fsyncs
+PRAGMA journal_mode=WAL;
+PRAGMA synchronous=NORMAL;
+PRAGMA temp_store=MEMORY;
+PRAGMA cache_size=-20000;
+PRAGMA busy_timeout=5000;
+
+-- Users table
+CREATE TABLE IF NOT EXISTS users (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    username TEXT UNIQUE NOT NULL,
+    password_hash TEXT NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Transactions table
+CREATE TABLE IF NOT EXISTS transactions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    type TEXT NOT NULL CHECK (type IN ('income', 'expense')),
+    amount REAL NOT NULL,
+    description TEXT NOT NULL,
+    category TEXT NOT NULL,
+    date DATE NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (user_id) REFERENCES users (id)
+);
+
+-- Budgets table
+CREATE TABLE IF NOT EXISTS budgets (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    category TEXT NOT NULL,
+    amount REAL NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (user_id) REFERENCES users (id),
+    UNIQUE(user_id, category)
+);
+
+-- Transaction indexes for history listing and report queries.
+-- Budgets need none: UNIQUE(user_id, category) is already indexed.
+CREATE INDEX IF NOT EXISTS idx_tx_user_date
+ON transactions (user_id, date);
+
+CREATE INDEX IF NOT EXISTS idx_tx_user_type_cat_date
+ON transactions (user_id, type, category, date);
+'''
+
+# Bumped whenever init_database gains a migration for existing databases
+SCHEMA_VERSION = 2
+
+# Number of monthly reports kept in DatabaseManager's in-memory cache
+REPORT_CACHE_SIZE = 256
+
+# SQL for the hottest statements, kept as module constants rather than inline
+# strings; the connection's enlarged cached_statements keeps them prepared
+ADD_TRANSACTION_SQL = '''INSERT INTO transactions 
+    (user_id, type, amount, description, category, date) 
+    VALUES (?, ?, ?, ?, ?, ?)'''
+
+MONTHLY_SPENDING_SQL = '''SELECT COALESCE(SUM(amount), 0) FROM transactions 
+    WHERE user_id = ? AND category = ? AND type = 'expense'
+    AND date >= ? AND date < ?'''
+
+MONTHLY_REPORT_SQL = '''SELECT type, category, SUM(amount) FROM transactions 
+    WHERE user_id = ? AND date >= ? AND date < ?
+    GROUP BY type, category'''
+
+GET_USER_SQL = "SELECT id, username, password_hash FROM users WHERE username = ?"
+
+GET_TRANSACTION_SQL = '''SELECT id, user_id, type, amount, description, category, date 
+    FROM transactions WHERE id = ? AND user_id = ?'''
+
+USER_BUDGETS_SQL = "SELECT id, user_id, category, amount FROM budgets WHERE user_id = ?"
+
+_HISTORY_SELECT = '''SELECT id, user_id, type, amount, description, category, date 
+    FROM transactions WHERE user_id = ?'''
+# Keyset pagination: continue right after the row with the given id,
+# without scanning the skipped rows
+_HISTORY_AFTER = ''' AND (date, id) < (
+    SELECT date, id FROM transactions WHERE id = ? AND user_id = ?)'''
+
+# Every variant of the history query, keyed by (paginated, limited)
+USER_TRANSACTIONS_SQL = {
+    (paginated, limited): (_HISTORY_SELECT + (_HISTORY_AFTER if paginated else '')
+                           + " ORDER BY date DESC, id DESC"
+                           + (" LIMIT ?" if limited else ''))
+    for paginated in (False, True)
+    for limited in (False, True)
+}
+
+# Bound parameters per multi-row INSERT, safely under the 999-variable limit
+# of SQLite builds older than 3.32
+MAX_INSERT_PARAMS = 500
+
+def _insert_rows(cursor: sqlite3.Cursor, insert_sql: str, rows: List[Tuple]) -> None:
+    """Insert rows in chunks using multi-row VALUES lists"""
+    if not rows:
+        return
+    
+    group = "(" + ", ".join("?" * len(rows[0])) + ")"
+    chunk_size = max(1, MAX_INSERT_PARAMS // len(rows[0]))
+    for i in range(0, len(rows), chunk_size):
+        chunk = rows[i:i + chunk_size]
+        params = [value for row in chunk for value in row]
+        cursor.execute(f"{insert_sql} VALUES {', '.join([group] * len(chunk))}", params)
+
+def _iso_date(value: Any) -> Optional[str]:
+    """Return a Y-M-D date string as zero-padded YYYY-MM-DD, or None if it isn't a date"""
+    try:
+        year, month, day = (int(part) for part in value.split('-'))
+        return date(year, month, day).isoformat()
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+def _month_range(year: int, month: int) -> Tuple[str, str]:
+    """Return the [start, end) ISO date bounds covering a calendar month"""
+    start = date(year, month, 1)
+    end = date(year + (month == 12), month % 12 + 1, 1)
+    return start.isoformat(), end.isoformat()
 
 class DatabaseManager:
     def __init__(self, db_name: str = "finance.db"):
         self.db_name = db_name
+        # One connection is shared by every method; the lock serializes access
+        # so the connection can safely be used from more than one thread.
+        self._conn = sqlite3.connect(
+            self.db_name, check_same_thread=False, isolation_level=None,
+            cached_statements=256
+        )
+        # Rows support access by column name as well as by position
+        self._conn.row_factory = sqlite3.Row
+        # Reentrant so bulk() can hold it while calling the other methods
+        self._lock = threading.RLock()
+        # LRU cache of monthly reports keyed by (user_id, year, month); any
+        # write to transactions clears it
+        self._report_cache = OrderedDict()
         self.init_database()
     
+    def close(self):
+        """Close the shared database connection"""
+        with self._lock:
+            self._conn.close()
+    
+    @contextmanager
+    def bulk(self):
+        """Run a block of database calls as one transaction"""
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                yield self
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                # Reports cached inside the block may include rolled-back rows
+                self._report_cache.clear()
+                raise
+            self._conn.execute("COMMIT")
+    
     def init_database(self):
         """Initialize database with required tables"""
-        with sqlite3.connect(self.db_name) as conn:
-            cursor = conn.cursor()
-            
-            # Users table
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS users (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    username TEXT UNIQUE NOT NULL,
-                    password_hash TEXT NOT NULL,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-            
-            # Transactions table
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS transactions (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER NOT NULL,
-                    type TEXT NOT NULL CHECK (type IN ('income', 'expense')),
-                    amount REAL NOT NULL,
-                    description TEXT NOT NULL,
-                    category TEXT NOT NULL,
-                    date DATE NOT NULL,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (user_id) REFERENCES users (id)
-                )
-            ''')
-            
-            # Budgets table
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS budgets (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER NOT NULL,
-                    category TEXT NOT NULL,
-                    amount REAL NOT NULL,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (user_id) REFERENCES users (id),
-                    UNIQUE(user_id, category)
+        with self._lock:
+            self._conn.executescript(SCHEMA_SQL)
+            self._migrate()
+    
+    def _migrate(self):
+        """Bring a database created by an older version up to SCHEMA_VERSION"""
+        version = self._conn.execute("PRAGMA user_version").fetchone()[0]
+        if version >= SCHEMA_VERSION:
+            return
+        
+        self._conn.execute("BEGIN")
+        try:
+            if version < 1:
+                # Older versions stored dates such as 2024-1-5, which fall into
+                # the wrong month under the reports' string range filters
+                rows = self._conn.execute(
+                    "SELECT id, date FROM transactions "
+                    "WHERE date NOT GLOB '[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]'"
+                ).fetchall()
+                self._conn.executemany(
+                    "UPDATE transactions SET date = ? WHERE id = ?",
+                    [(_iso_date(old), trans_id) for trans_id, old in rows if _iso_date(old)]
                 )
-            ''')
-            
-            conn.commit()
+            if version < 2:
+                # A (user_id, date DESC) index left the history query's id DESC
+                # tie-break to a temp B-tree; read backwards, the ascending
+                # index orders by date DESC, id DESC by itself
+                self._conn.execute("DROP INDEX IF EXISTS idx_tx_user_date")
+                self._conn.execute("CREATE INDEX idx_tx_user_date ON transactions (user_id, date)")
+            self._conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+        self._conn.execute("COMMIT")
     
-    def create_user(self, username: str, password_hash: str) -> bool:
-        """Create a new user"""
+    def create_user(self, username: str, password_hash: str) -> Union[int, bool, None]:
+        """Create a new user and return its id, False if the username is taken or None on error"""
         try:
-            with sqlite3.connect(self.db_name) as conn:
-                cursor = conn.cursor()
+            with self._lock:
+                cursor = self._conn.cursor()
                 cursor.execute(
                     "INSERT INTO users (username, password_hash) VALUES (?, ?)",
                     (username, password_hash)
                 )
-                conn.commit()
-                return True
+                return cursor.lastrowid
         except sqlite3.IntegrityError:
             return False
-        except Exception:
-            return False
+        except sqlite3.Error:
+            return None
     
-    def get_user(self, username: str) -> Optional[Tuple]:
+    def get_user(self, username: str) -> Optional[sqlite3.Row]:
         """Get user by username"""
         try:
-            with sqlite3.connect(self.db_name) as conn:
-                cursor = conn.cursor()
-                cursor.execute(
-                    "SELECT id, username, password_hash FROM users WHERE username = ?",
-                    (username,)
-                )
-                return cursor.fetchone()
-        except Exception:
+            with self._lock:
+                return self._conn.execute(GET_USER_SQL, (username,)).fetchone()
+        except sqlite3.Error:
             return None
     
-    def authenticate_user(self, username: str, password_hash: str) -> Optional[Tuple]:
-        """Authenticate user credentials"""
+    def update_password_hash(self, user_id: int, password_hash: str) -> bool:
+        """Replace a user's stored password hash"""
         try:
-            with sqlite3.connect(self.db_name) as conn:
-                cursor = conn.cursor()
+            with self._lock:
+                cursor = self._conn.cursor()
                 cursor.execute(
-                    "SELECT id, username FROM users WHERE username = ? AND password_hash = ?",
-                    (username, password_hash)
+                    "UPDATE users SET password_hash = ? WHERE id = ?",
+                    (password_hash, user_id)
                 )
-                return cursor.fetchone()
-        except Exception:
-            return None
+                return cursor.rowcount > 0
+        except sqlite3.Error:
+            return False
     
     def add_transaction(self, user_id: int, trans_type: str, amount: float, 
-                       description: str, category: str, date: str) -> bool:
-        """Add a new transaction"""
+                       description: str, category: str, date: str) -> Optional[int]:
+        """Add a new transaction and return its id"""
         try:
-            with sqlite3.connect(self.db_name) as conn:
-                cursor = conn.cursor()
+            with self._lock:
+                self._report_cache.clear()
+                cursor = self._conn.cursor()
                 cursor.execute(
-                    '''INSERT INTO transactions 
-                       (user_id, type, amount, description, category, date) 
-                       VALUES (?, ?, ?, ?, ?, ?)''',
+                    ADD_TRANSACTION_SQL,
                     (user_id, trans_type, amount, description, category, date)
                 )
-                conn.commit()
-                return True
-        except Exception:
-            return False
+                return cursor.lastrowid
+        except sqlite3.Error:
+            return None
     
-    def get_user_transactions(self, user_id: int) -> List[Tuple]:
-        """Get all transactions for a user"""
+    def get_user_transactions(self, user_id: int, limit: Optional[int] = None,
+                              before_id: Optional[int] = None) -> List[sqlite3.Row]:
+        """Get transactions for a user, optionally one page at a time"""
+        return list(self.get_user_transactions_iter(user_id, limit=limit, before_id=before_id))
+    
+    def get_user_transactions_iter(self, user_id: int, batch: int = 500,
+                                   limit: Optional[int] = None,
+                                   before_id: Optional[int] = None) -> Iterator[sqlite3.Row]:
+        """Yield a user's transactions, newest first, fetching them in batches"""
+        sql = USER_TRANSACTIONS_SQL[before_id is not None, limit is not None]
+        params = [user_id]
+        # Pass the id of the last row of the previous page to get the next one
+        if before_id is not None:
+            params += [before_id, user_id]
+        if limit is not None:
+            params.append(limit)
+        
         try:
-            with sqlite3.connect(self.db_name) as conn:
-                cursor = conn.cursor()
-                cursor.execute(
-                    '''SELECT id, user_id, type, amount, description, category, date 
-                       FROM transactions WHERE user_id = ? 
-                       ORDER BY date DESC, id DESC''',
-                    (user_id,)
-                )
-                return cursor.fetchall()
-        except Exception:
-            return []
+            with self._lock:
+                cursor = self._conn.cursor()
+                cursor.execute(sql, params)
+                rows = cursor.fetchmany(batch)
+        except sqlite3.Error:
+            return
+        
+        # The lock is only held while fetching, so callers may run other
+        # queries between batches. Errors from here on propagate rather than
+        # silently truncating the history.
+        while rows:
+            yield from rows
+            with self._lock:
+                rows = cursor.fetchmany(batch)
     
-    def get_transaction(self, trans_id: int, user_id: int) -> Optional[Tuple]:
+    def get_transaction(self, trans_id: int, user_id: int) -> Optional[sqlite3.Row]:
         """Get specific transaction"""
         try:
-            with sqlite3.connect(self.db_name) as conn:
-                cursor = conn.cursor()
-                cursor.execute(
-                    '''SELECT id, user_id, type, amount, description, category, date 
-                       FROM transactions WHERE id = ? AND user_id = ?''',
-                    (trans_id, user_id)
-                )
-                return cursor.fetchone()
-        except Exception:
+            with self._lock:
+                return self._conn.execute(GET_TRANSACTION_SQL, (trans_id, user_id)).fetchone()
+        except sqlite3.Error:
             return None
     
     def update_transaction(self, trans_id: int, amount: float, description: str, 
                           category: str, date: str) -> bool:
         """Update existing transaction"""
         try:
-            with sqlite3.connect(self.db_name) as conn:
-                cursor = conn.cursor()
+            with self._lock:
+                self._report_cache.clear()
+                cursor = self._conn.cursor()
                 cursor.execute(
                     '''UPDATE transactions 
                        SET amount = ?, description = ?, category = ?, date = ? 
                        WHERE id = ?''',
                     (amount, description, category, date, trans_id)
                 )
-                conn.commit()
                 return cursor.rowcount > 0
-        except Exception:
+        except sqlite3.Error:
             return False
     
     def delete_transaction(self, trans_id: int) -> bool:
         """Delete transaction"""
         try:
-            with sqlite3.connect(self.db_name) as conn:
-                cursor = conn.cursor()
+            with self._lock:
+                self._report_cache.clear()
+                cursor = self._conn.cursor()
                 cursor.execute("DELETE FROM transactions WHERE id = ?", (trans_id,))
-                conn.commit()
                 return cursor.rowcount > 0
-        except Exception:
+        except sqlite3.Error:
             return False
     
     def get_monthly_report(self, user_id: int, year: int, month: int) -> Dict[str, Any]:
         """Generate monthly financial report"""
+        key = (user_id, year, month)
         try:
-            with sqlite3.connect(self.db_name) as conn:
-                cursor = conn.cursor()
+            with self._lock:
+                # Cached reports are shared, so callers must not modify them
+                report = self._report_cache.get(key)
+                if report is not None:
+                    self._report_cache.move_to_end(key)
+                    return report
                 
-                # Get monthly totals
-                cursor.execute(
-                    '''SELECT type, SUM(amount) FROM transactions 
-                       WHERE user_id = ? AND strftime('%Y', date) = ? AND strftime('%m', date) = ?
-                       GROUP BY type''',
-                    (user_id, str(year), f"{month:02d}")
-                )
+                cursor = self._conn.cursor()
+                start, end = _month_range(year, month)
                 
-                totals = dict(cursor.fetchall())
-                total_income = totals.get('income', 0)
-                total_expenses = totals.get('expense', 0)
+                # Totals and per-category breakdowns from a single pass
+                cursor.execute(MONTHLY_REPORT_SQL, (user_id, start, end))
                 
-                # Get income by category
-                cursor.execute(
-                    '''SELECT category, SUM(amount) FROM transactions 
-                       WHERE user_id = ? AND type = 'income' 
-                       AND strftime('%Y', date) = ? AND strftime('%m', date) = ?
-                       GROUP BY category''',
-                    (user_id, str(year), f"{month:02d}")
-                )
-                income_by_category = dict(cursor.fetchall())
+                income_by_category = {}
+                expenses_by_category = {}
+                for trans_type, category, amount in cursor.fetchall():
+                    if trans_type == 'income':
+                        income_by_category[category] = amount
+                    else:
+                        expenses_by_category[category] = amount
                 
-                # Get expenses by category
-                cursor.execute(
-                    '''SELECT category, SUM(amount) FROM transactions 
-                       WHERE user_id = ? AND type = 'expense' 
-                       AND strftime('%Y', date) = ? AND strftime('%m', date) = ?
-                       GROUP BY category''',
-                    (user_id, str(year), f"{month:02d}")
-                )
-                expenses_by_category = dict(cursor.fetchall())
+                total_income = sum(income_by_category.values())
+                total_expenses = sum(expenses_by_category.values())
                 
-                return {
+                report = {
                     'total_income': total_income,
                     'total_expenses': total_expenses,
                     'net_savings': total_income - total_expenses,
                     'income_by_category': income_by_category,
                     'expenses_by_category': expenses_by_category
                 }
-        except Exception:
+                self._report_cache[key] = report
+                if len(self._report_cache) > REPORT_CACHE_SIZE:
+                    self._report_cache.popitem(last=False)
+                return report
+        except (sqlite3.Error, ValueError):
             return {
                 'total_income': 0,
                 'total_expenses': 0,
@@ -230,52 +377,37 @@ class DatabaseManager:
     def get_yearly_report(self, user_id: int, year: int) -> Dict[str, Any]:
         """Generate yearly financial report"""
         try:
-            with sqlite3.connect(self.db_name) as conn:
-                cursor = conn.cursor()
+            with self._lock:
+                cursor = self._conn.cursor()
+                start = date(year, 1, 1).isoformat()
+                end = date(year + 1, 1, 1).isoformat()
                 
-                # Get yearly totals
-                cursor.execute(
-                    '''SELECT type, SUM(amount) FROM transactions 
-                       WHERE user_id = ? AND strftime('%Y', date) = ?
-                       GROUP BY type''',
-                    (user_id, str(year))
-                )
-                
-                totals = dict(cursor.fetchall())
-                total_income = totals.get('income', 0)
-                total_expenses = totals.get('expense', 0)
-                
-                # Get monthly summary
+                # Get monthly summary; rows are slotted by month, so no ORDER BY
                 cursor.execute(
                     '''SELECT strftime('%m', date) as month, type, SUM(amount) 
                        FROM transactions 
-                       WHERE user_id = ? AND strftime('%Y', date) = ?
-                       GROUP BY month, type
-                       ORDER BY month''',
-                    (user_id, str(year))
+                       WHERE user_id = ? AND date >= ? AND date < ?
+                       GROUP BY month, type''',
+                    (user_id, start, end)
                 )
                 
-                monthly_data = {}
-                for row in cursor.fetchall():
-                    month, trans_type, amount = row
-                    month_int = int(month)
-                    if month_int not in monthly_data:
-                        monthly_data[month_int] = {'income': 0, 'expenses': 0}
-                    
-                    if trans_type == 'income':
-                        monthly_data[month_int]['income'] = amount
-                    else:
-                        monthly_data[month_int]['expenses'] = amount
+                monthly_summary = [
+                    {'month': month, 'income': 0, 'expenses': 0, 'savings': 0}
+                    for month in range(1, 13)
+                ]
+                for month, trans_type, amount in cursor.fetchall():
+                    # Rows whose date SQLite can't parse have no month
+                    if month is None:
+                        continue
+                    slot = monthly_summary[int(month) - 1]
+                    slot['income' if trans_type == 'income' else 'expenses'] = amount
                 
-                monthly_summary = []
-                for month in range(1, 13):
-                    data = monthly_data.get(month, {'income': 0, 'expenses': 0})
-                    monthly_summary.append({
-                        'month': month,
-                        'income': data['income'],
-                        'expenses': data['expenses'],
-                        'savings': data['income'] - data['expenses']
-                    })
+                for slot in monthly_summary:
+                    slot['savings'] = slot['income'] - slot['expenses']
+                
+                # Yearly totals fall out of the monthly sums
+                total_income = sum(slot['income'] for slot in monthly_summary)
+                total_expenses = sum(slot['expenses'] for slot in monthly_summary)
                 
                 return {
                     'total_income': total_income,
@@ -283,7 +415,7 @@ class DatabaseManager:
                     'net_savings': total_income - total_expenses,
                     'monthly_summary': monthly_summary
                 }
-        except Exception:
+        except (sqlite3.Error, ValueError):
             return {
                 'total_income': 0,
                 'total_expenses': 0,
@@ -294,123 +426,139 @@ class DatabaseManager:
     def get_category_summary(self, user_id: int) -> Dict[str, Dict[str, float]]:
         """Get category-wise summary"""
         try:
-            with sqlite3.connect(self.db_name) as conn:
-                cursor = conn.cursor()
+            with self._lock:
+                cursor = self._conn.cursor()
                 
-                # Income categories
+                # Income and expense categories in one pass
                 cursor.execute(
-                    '''SELECT category, SUM(amount) FROM transactions 
-                       WHERE user_id = ? AND type = 'income'
-                       GROUP BY category''',
+                    '''SELECT type, category, SUM(amount) FROM transactions 
+                       WHERE user_id = ?
+                       GROUP BY type, category''',
                     (user_id,)
                 )
-                income_categories = dict(cursor.fetchall())
                 
-                # Expense categories
-                cursor.execute(
-                    '''SELECT category, SUM(amount) FROM transactions 
-                       WHERE user_id = ? AND type = 'expense'
-                       GROUP BY category''',
-                    (user_id,)
-                )
-                expense_categories = dict(cursor.fetchall())
+                income_categories = {}
+                expense_categories = {}
+                for trans_type, category, amount in cursor.fetchall():
+                    if trans_type == 'income':
+                        income_categories[category] = amount
+                    else:
+                        expense_categories[category] = amount
                 
                 return {
                     'income_categories': income_categories,
                     'expense_categories': expense_categories
                 }
-        except Exception:
+        except sqlite3.Error:
             return {'income_categories': {}, 'expense_categories': {}}
     
     def set_budget(self, user_id: int, category: str, amount: float) -> bool:
         """Set budget for a category"""
         try:
-            with sqlite3.connect(self.db_name) as conn:
-                cursor = conn.cursor()
+            with self._lock:
+                cursor = self._conn.cursor()
                 cursor.execute(
                     '''INSERT OR REPLACE INTO budgets (user_id, category, amount) 
                        VALUES (?, ?, ?)''',
                     (user_id, category, amount)
                 )
-                conn.commit()
                 return True
-        except Exception:
+        except sqlite3.Error:
             return False
     
-    def get_user_budgets(self, user_id: int) -> List[Tuple]:
+    def get_user_budgets(self, user_id: int) -> List[sqlite3.Row]:
         """Get all budgets for a user"""
         try:
-            with sqlite3.connect(self.db_name) as conn:
-                cursor = conn.cursor()
-                cursor.execute(
-                    "SELECT id, user_id, category, amount FROM budgets WHERE user_id = ?",
-                    (user_id,)
-                )
-                return cursor.fetchall()
-        except Exception:
+            with self._lock:
+                return self._conn.execute(USER_BUDGETS_SQL, (user_id,)).fetchall()
+        except sqlite3.Error:
             return []
     
     def get_category_budget(self, user_id: int, category: str) -> Optional[float]:
         """Get budget amount for specific category"""
         try:
-            with sqlite3.connect(self.db_name) as conn:
-                cursor = conn.cursor()
-                cursor.execute(
+            with self._lock:
+                result = self._conn.execute(
                     "SELECT amount FROM budgets WHERE user_id = ? AND category = ?",
                     (user_id, category)
-                )
-                result = cursor.fetchone()
+                ).fetchone()
                 return result[0] if result else None
-        except Exception:
+        except sqlite3.Error:
             return None
     
     def update_budget(self, budget_id: int, amount: float) -> bool:
         """Update budget amount"""
         try:
-            with sqlite3.connect(self.db_name) as conn:
-                cursor = conn.cursor()
+            with self._lock:
+                cursor = self._conn.cursor()
                 cursor.execute(
                     "UPDATE budgets SET amount = ? WHERE id = ?",
                     (amount, budget_id)
                 )
-                conn.commit()
                 return cursor.rowcount > 0
-        except Exception:
+        except sqlite3.Error:
             return False
     
     def delete_budget(self, budget_id: int) -> bool:
         """Delete budget"""
         try:
-            with sqlite3.connect(self.db_name) as conn:
-                cursor = conn.cursor()
+            with self._lock:
+                cursor = self._conn.cursor()
                 cursor.execute("DELETE FROM budgets WHERE id = ?", (budget_id,))
-                conn.commit()
                 return cursor.rowcount > 0
-        except Exception:
+        except sqlite3.Error:
             return False
     
     def get_monthly_spending(self, user_id: int, category: str, month_year: str) -> float:
         """Get total spending for a category in a specific month"""
         try:
             year, month = month_year.split('-')
-            with sqlite3.connect(self.db_name) as conn:
-                cursor = conn.cursor()
-                cursor.execute(
-                    '''SELECT COALESCE(SUM(amount), 0) FROM transactions 
-                       WHERE user_id = ? AND category = ? AND type = 'expense'
-                       AND strftime('%Y', date) = ? AND strftime('%m', date) = ?''',
-                    (user_id, category, year, f"{int(month):02d}")
-                )
-                result = cursor.fetchone()
+            start, end = _month_range(int(year), int(month))
+            with self._lock:
+                result = self._conn.execute(
+                    MONTHLY_SPENDING_SQL,
+                    (user_id, category, start, end)
+                ).fetchone()
                 return result[0] if result else 0
-        except Exception:
+        except (sqlite3.Error, ValueError):
             return 0
     
+    def get_monthly_spending_all(self, user_id: int, month_year: str) -> Dict[str, float]:
+        """Get total spending per category in a specific month"""
+        try:
+            year, month = month_year.split('-')
+            start, end = _month_range(int(year), int(month))
+            with self._lock:
+                rows = self._conn.execute(
+                    '''SELECT category, SUM(amount) FROM transactions 
+                       WHERE user_id = ? AND type = 'expense'
+                       AND date >= ? AND date < ?
+                       GROUP BY category''',
+                    (user_id, start, end)
+                ).fetchall()
+                return {category: total for category, total in rows}
+        except (sqlite3.Error, ValueError):
+            return {}
+    
+    def get_all_monthly_spending(self, user_id: int) -> Dict[Tuple[str, str], float]:
+        """Get total spending per (category, YYYY-MM) across a user's history"""
+        try:
+            with self._lock:
+                rows = self._conn.execute(
+                    '''SELECT category, substr(date, 1, 7), SUM(amount) FROM transactions 
+                       WHERE user_id = ? AND type = 'expense'
+                       GROUP BY category, substr(date, 1, 7)''',
+                    (user_id,)
+                ).fetchall()
+                return {(category, month_year): total for category, month_year, total in rows}
+        except sqlite3.Error:
+            return {}
+    
     def get_user_backup_data(self, user_id: int) -> Dict[str, Any]:
         """Get all user data for backup"""
         try:
-            with sqlite3.connect(self.db_name) as conn:
-                cursor = conn.cursor()
+            with self._lock:
+                cursor = self._conn.cursor()
                 
                 # Get transactions
                 cursor.execute(
@@ -418,16 +566,8 @@ class DatabaseManager:
                        FROM transactions WHERE user_id = ?''',
                     (user_id,)
                 )
-                transactions = [
-                    {
-                        'type': row[0],
-                        'amount': row[1],
-                        'description': row[2],
-                        'category': row[3],
-                        'date': row[4]
-                    }
-                    for row in cursor.fetchall()
-                ]
+                fields = ('type', 'amount', 'description', 'category', 'date')
+                transactions = [dict(zip(fields, row)) for row in cursor]
                 
                 # Get budgets
                 cursor.execute(
@@ -435,8 +575,8 @@ class DatabaseManager:
                     (user_id,)
                 )
                 budgets = [
-                    {'category': row[0], 'amount': row[1]}
-                    for row in cursor.fetchall()
+                    {'category': category, 'amount': amount}
+                    for category, amount in cursor
                 ]
                 
                 return {
@@ -444,37 +584,56 @@ class DatabaseManager:
                     'transactions': transactions,
                     'budgets': budgets
                 }
-        except Exception:
+        except sqlite3.Error:
             return {'backup_date': datetime.now().isoformat(), 'transactions': [], 'budgets': []}
     
     def restore_user_data(self, user_id: int, backup_data: Dict[str, Any]) -> bool:
         """Restore user data from backup"""
-        try:
-            with sqlite3.connect(self.db_name) as conn:
-                cursor = conn.cursor()
-                
+        with self._lock:
+            self._report_cache.clear()
+            cursor = self._conn.cursor()
+            try:
+                # A savepoint keeps the restore all-or-nothing and also nests
+                # cleanly if the caller already has a transaction open
+                cursor.execute("SAVEPOINT restore")
+            except sqlite3.Error:
+                return False
+            
+            try:
                 # Clear existing data
                 cursor.execute("DELETE FROM transactions WHERE user_id = ?", (user_id,))
                 cursor.execute("DELETE FROM budgets WHERE user_id = ?", (user_id,))
                 
-                # Restore transactions
+                # Restore transactions; reports rely on YYYY-MM-DD dates
+                rows = []
                 for trans in backup_data.get('transactions', []):
-                    cursor.execute(
-                        '''INSERT INTO transactions 
-                           (user_id, type, amount, description, category, date) 
-                           VALUES (?, ?, ?, ?, ?, ?)''',
-                        (user_id, trans['type'], trans['amount'], 
-                         trans['description'], trans['category'], trans['date'])
-                    )
+                    if _iso_date(trans['date']) != trans['date']:
+                        raise ValueError(f"Invalid transaction date: {trans['date']!r}")
+                    rows.append((user_id, trans['type'], trans['amount'],
+                                 trans['description'], trans['category'], trans['date']))
+                _insert_rows(
+                    cursor,
+                    '''INSERT INTO transactions 
+                       (user_id, type, amount, description, category, date)''',
+                    rows
+                )
                 
-                # Restore budgets
-                for budget in backup_data.get('budgets', []):
-                    cursor.execute(
-                        "INSERT INTO budgets (user_id, category, amount) VALUES (?, ?, ?)",
+                # Restore budgets; a repeated category keeps its last amount
+                _insert_rows(
+                    cursor,
+                    "INSERT OR REPLACE INTO budgets (user_id, category, amount)",
+                    [
                         (user_id, budget['category'], budget['amount'])
-                    )
+                        for budget in backup_data.get('budgets', [])
+                    ]
+                )
                 
-                conn.commit()
+                cursor.execute("RELEASE restore")
                 return True
-        except Exception:
-            return False
\ No newline at end of file
+            except BaseException as e:
+                # Never leave the savepoint open, or later writes would be lost with it
+                cursor.execute("ROLLBACK TO restore")
+                cursor.execute("RELEASE restore")
+                if isinstance(e, (sqlite3.Error, AttributeError, KeyError, TypeError, ValueError)):
+                    return False
+                raise
\ No newline at end of file
@@ -3,14 +3,24 @@ Core Finance Manager class handling all financial operations
 """
 
 import sqlite3
-import hashlib
 import getpass
 import json
-import os
-from datetime import datetime, timedelta
+import sys
+from datetime import date, datetime, timedelta
 from typing import Dict, List, Optional, Tuple
 from database import DatabaseManager
-from utils import get_user_input, validate_amount, validate_date, clear_screen
+from utils import (get_user_input, validate_amount_cli, validate_date, clear_screen,
+                   get_month_name, hash_password, verify_password, password_needs_rehash,
+                   PASSWORD_HASH_ITERATIONS)
+
+try:
+    import orjson  # Optional: much faster JSON encoding for backups
+except ImportError:
+    orjson = None
+
+# Verified against for unknown usernames, so a failed login costs the same
+# key derivation whether or not the username exists
+_DUMMY_PASSWORD_HASH = f"pbkdf2_sha256${PASSWORD_HASH_ITERATIONS}${'00' * 16}${'00' * 32}"
 
 class FinanceManager:
     def __init__(self):
@@ -18,6 +28,10 @@ class FinanceManager:
         self.current_user = None
         self.current_user_id = None
         
+        # Per-user caches so budget checks don't hit the database on every expense
+        self._budget_cache = None
+        self._spend_cache = None
+        
         # Predefined categories
         self.income_categories = [
             "Salary", "Freelance", "Investment", "Business", "Gift", "Other"
@@ -26,6 +40,14 @@ class FinanceManager:
             "Food", "Rent", "Transportation", "Entertainment", "Healthcare",
             "Shopping", "Utilities", "Education", "Travel", "Other"
         ]
+        
+        # Numbered category menus are fixed, so build them once
+        self._income_menu = "\n".join(
+            f"{i}. {category}" for i, category in enumerate(self.income_categories, 1)
+        )
+        self._expense_menu = "\n".join(
+            f"{i}. {category}" for i, category in enumerate(self.expense_categories, 1)
+        )
     
     def register(self):
         """Register a new user"""
@@ -37,11 +59,6 @@ class FinanceManager:
             print("Username cannot be empty!")
             return
         
-        # Check if username exists
-        if self.db.get_user(username):
-            print("Username already exists! Please choose a different one.")
-            return
-        
         password = getpass.getpass("Enter password: ")
         if len(password) < 6:
             print("Password must be at least 6 characters long!")
@@ -52,12 +69,15 @@ class FinanceManager:
             print("Passwords don't match!")
             return
         
-        # Hash password
-        password_hash = hashlib.sha256(password.encode()).hexdigest()
+        # Hash password with a per-user salt
+        password_hash = hash_password(password)
         
-        # Create user
-        if self.db.create_user(username, password_hash):
+        # Create user; the UNIQUE username constraint rejects duplicates
+        user_id = self.db.create_user(username, password_hash)
+        if user_id:
             print(f"User '{username}' registered successfully!")
+        elif user_id is False:
+            print("Username already exists! Please choose a different one.")
         else:
             print("Registration failed. Please try again.")
     
@@ -69,21 +89,31 @@ class FinanceManager:
         username = get_user_input("Enter username: ").strip()
         password = getpass.getpass("Enter password: ")
         
-        # Hash password
-        password_hash = hashlib.sha256(password.encode()).hexdigest()
-        
-        user = self.db.authenticate_user(username, password_hash)
-        if user:
+        user = self.db.get_user(username)
+        if user and verify_password(password, user["password_hash"]):
+            # Upgrade legacy or weaker hashes now that we have the password
+            if password_needs_rehash(user["password_hash"]):
+                self.db.update_password_hash(user["id"], hash_password(password))
+            
             self.current_user = username
-            self.current_user_id = user[0]
+            self.current_user_id = user["id"]
+            self._load_budget_cache()
             print(f"Welcome back, {username}!")
         else:
+            if user is None:
+                verify_password(password, _DUMMY_PASSWORD_HASH)
             print("Invalid username or password!")
     
+    def close(self):
+        """Release the database connection"""
+        self.db.close()
+    
     def logout(self):
         """Logout current user"""
         self.current_user = None
         self.current_user_id = None
+        self._budget_cache = None
+        self._spend_cache = None
         print("Logged out successfully!")
     
     def add_income(self):
@@ -91,7 +121,7 @@ class FinanceManager:
         clear_screen()
         print("=== Add Income ===")
         
-        amount = validate_amount(get_user_input("Enter amount: $"))
+        amount = validate_amount_cli(get_user_input("Enter amount: $"))
         if amount is None:
             return
         
@@ -101,8 +131,7 @@ class FinanceManager:
             return
         
         print("\nIncome Categories:")
-        for i, category in enumerate(self.income_categories, 1):
-            print(f"{i}. {category}")
+        print(self._income_menu)
         
         try:
             cat_choice = int(get_user_input("Select category (number): "))
@@ -117,7 +146,7 @@ class FinanceManager:
         
         date_str = get_user_input("Enter date (YYYY-MM-DD) or press Enter for today: ").strip()
         if not date_str:
-            date_str = datetime.now().strftime("%Y-%m-%d")
+            date_str = date.today().isoformat()
         
         if not validate_date(date_str):
             print("Invalid date format!")
@@ -134,7 +163,7 @@ class FinanceManager:
         clear_screen()
         print("=== Add Expense ===")
         
-        amount = validate_amount(get_user_input("Enter amount: $"))
+        amount = validate_amount_cli(get_user_input("Enter amount: $"))
         if amount is None:
             return
         
@@ -144,8 +173,7 @@ class FinanceManager:
             return
         
         print("\nExpense Categories:")
-        for i, category in enumerate(self.expense_categories, 1):
-            print(f"{i}. {category}")
+        print(self._expense_menu)
         
         try:
             cat_choice = int(get_user_input("Select category (number): "))
@@ -160,17 +188,19 @@ class FinanceManager:
         
         date_str = get_user_input("Enter date (YYYY-MM-DD) or press Enter for today: ").strip()
         if not date_str:
-            date_str = datetime.now().strftime("%Y-%m-%d")
+            date_str = date.today().isoformat()
         
         if not validate_date(date_str):
             print("Invalid date format!")
             return
         
-        # Check budget before adding expense
-        self._check_budget_warning(category, amount, date_str)
+        # Check budget before adding expense; declining the warning cancels it
+        if not self._check_budget_warning(category, amount, date_str):
+            return
         
         if self.db.add_transaction(self.current_user_id, "expense", amount, 
                                  description, category, date_str):
+            self._record_spending(category, date_str, amount)
             print("Expense added successfully!")
         else:
             print("Failed to add expense!")
@@ -189,10 +219,12 @@ class FinanceManager:
         print(f"{'ID':<5} {'Type':<8} {'Amount':<12} {'Category':<15} {'Description':<20} {'Date':<12}")
         print("-" * 80)
         
-        for transaction in transactions:
-            trans_id, _, trans_type, amount, description, category, date = transaction
-            amount_str = f"${amount:.2f}"
-            print(f"{trans_id:<5} {trans_type:<8} {amount_str:<12} {category:<15} {description[:18]:<20} {date:<12}")
+        # Format every row into one buffer and write it in a single call
+        sys.stdout.write("\n".join(
+            f"{t['id']:<5} {t['type']:<8} ${t['amount']:<11.2f} {t['category']:<15} "
+            f"{t['description'][:18]:<20} {t['date']:<12}"
+            for t in transactions
+        ) + "\n")
         
         input("\nPress Enter to continue...")
     
@@ -212,7 +244,11 @@ class FinanceManager:
             print("Transaction not found or you don't have permission to update it!")
             return
         
-        _, _, trans_type, old_amount, old_desc, old_category, old_date = transaction
+        trans_type = transaction["type"]
+        old_amount = transaction["amount"]
+        old_desc = transaction["description"]
+        old_category = transaction["category"]
+        old_date = transaction["date"]
         
         print(f"\nCurrent transaction details:")
         print(f"Type: {trans_type}")
@@ -225,7 +261,7 @@ class FinanceManager:
         
         # Update amount
         new_amount_str = get_user_input(f"Amount (${old_amount:.2f}): ").strip()
-        new_amount = validate_amount(new_amount_str) if new_amount_str else old_amount
+        new_amount = validate_amount_cli(new_amount_str) if new_amount_str else old_amount
         if new_amount is None:
             new_amount = old_amount
         
@@ -235,11 +271,13 @@ class FinanceManager:
             new_desc = old_desc
         
         # Update category
-        categories = self.income_categories if trans_type == "income" else self.expense_categories
+        if trans_type == "income":
+            categories, menu = self.income_categories, self._income_menu
+        else:
+            categories, menu = self.expense_categories, self._expense_menu
         print(f"\nCurrent category: {old_category}")
         print("Categories:")
-        for i, category in enumerate(categories, 1):
-            print(f"{i}. {category}")
+        print(menu)
         
         cat_input = get_user_input("Select new category (number) or press Enter to keep current: ").strip()
         if cat_input:
@@ -263,6 +301,9 @@ class FinanceManager:
             new_date = old_date
         
         if self.db.update_transaction(trans_id, new_amount, new_desc, new_category, new_date):
+            if trans_type == "expense":
+                self._record_spending(old_category, old_date, -old_amount)
+                self._record_spending(new_category, new_date, new_amount)
             print("Transaction updated successfully!")
         else:
             print("Failed to update transaction!")
@@ -283,17 +324,19 @@ class FinanceManager:
             print("Transaction not found or you don't have permission to delete it!")
             return
         
-        _, _, trans_type, amount, desc, category, date = transaction
         print(f"\nTransaction to delete:")
-        print(f"Type: {trans_type}")
-        print(f"Amount: ${amount:.2f}")
-        print(f"Description: {desc}")
-        print(f"Category: {category}")
-        print(f"Date: {date}")
+        print(f"Type: {transaction['type']}")
+        print(f"Amount: ${transaction['amount']:.2f}")
+        print(f"Description: {transaction['description']}")
+        print(f"Category: {transaction['category']}")
+        print(f"Date: {transaction['date']}")
         
         confirm = get_user_input("\nAre you sure you want to delete this transaction? (y/N): ").lower()
         if confirm == 'y':
             if self.db.delete_transaction(trans_id):
+                if transaction["type"] == "expense":
+                    self._record_spending(transaction["category"], transaction["date"],
+                                          -transaction["amount"])
                 print("Transaction deleted successfully!")
             else:
                 print("Failed to delete transaction!")
@@ -324,33 +367,39 @@ class FinanceManager:
         month_year = get_user_input("Enter month and year (YYYY-MM) or press Enter for current month: ").strip()
         
         if not month_year:
-            now = datetime.now()
-            month_year = now.strftime("%Y-%m")
-        
-        try:
-            year, month = map(int, month_year.split("-"))
-            if not (1 <= month <= 12):
-                raise ValueError
-        except ValueError:
-            print("Invalid month format! Use YYYY-MM")
-            return
+            today = date.today()
+            year, month = today.year, today.month
+            month_year = f"{year}-{month:02d}"
+        else:
+            try:
+                year, month = map(int, month_year.split("-"))
+                if not (1 <= month <= 12):
+                    raise ValueError
+            except ValueError:
+                print("Invalid month format! Use YYYY-MM")
+                return
         
         report = self.db.get_monthly_report(self.current_user_id, year, month)
         
-        print(f"\n=== Monthly Report for {month_year} ===")
-        print(f"Total Income: ${report['total_income']:.2f}")
-        print(f"Total Expenses: ${report['total_expenses']:.2f}")
-        print(f"Net Savings: ${report['net_savings']:.2f}")
+        # Build the whole report first and write it in a single call
+        lines = [
+            f"\n=== Monthly Report for {month_year} ===",
+            f"Total Income: ${report['total_income']:.2f}",
+            f"Total Expenses: ${report['total_expenses']:.2f}",
+            f"Net Savings: ${report['net_savings']:.2f}",
+        ]
         
         if report['income_by_category']:
-            print("\nIncome by Category:")
+            lines.append("\nIncome by Category:")
             for category, amount in report['income_by_category'].items():
-                print(f"  {category}: ${amount:.2f}")
+                lines.append(f"  {category}: ${amount:.2f}")
         
         if report['expenses_by_category']:
-            print("\nExpenses by Category:")
+            lines.append("\nExpenses by Category:")
             for category, amount in report['expenses_by_category'].items():
-                print(f"  {category}: ${amount:.2f}")
+                lines.append(f"  {category}: ${amount:.2f}")
+        
+        sys.stdout.write("\n".join(lines) + "\n")
         
         input("\nPress Enter to continue...")
     
@@ -369,18 +418,22 @@ class FinanceManager:
         
         report = self.db.get_yearly_report(self.current_user_id, year)
         
-        print(f"\n=== Yearly Report for {year} ===")
-        print(f"Total Income: ${report['total_income']:.2f}")
-        print(f"Total Expenses: ${report['total_expenses']:.2f}")
-        print(f"Net Savings: ${report['net_savings']:.2f}")
+        lines = [
+            f"\n=== Yearly Report for {year} ===",
+            f"Total Income: ${report['total_income']:.2f}",
+            f"Total Expenses: ${report['total_expenses']:.2f}",
+            f"Net Savings: ${report['net_savings']:.2f}",
+        ]
         
         if report['monthly_summary']:
-            print("\nMonthly Summary:")
+            lines.append("\nMonthly Summary:")
             for month_data in report['monthly_summary']:
-                month_name = datetime(year, month_data['month'], 1).strftime("%B")
-                print(f"  {month_name}: Income ${month_data['income']:.2f}, "
-                      f"Expenses ${month_data['expenses']:.2f}, "
-                      f"Savings ${month_data['savings']:.2f}")
+                month_name = get_month_name(month_data['month'])
+                lines.append(f"  {month_name}: Income ${month_data['income']:.2f}, "
+                             f"Expenses ${month_data['expenses']:.2f}, "
+                             f"Savings ${month_data['savings']:.2f}")
+        
+        sys.stdout.write("\n".join(lines) + "\n")
         
         input("\nPress Enter to continue...")
     
@@ -427,8 +480,7 @@ class FinanceManager:
     def _set_budget(self):
         """Set monthly budget for a category"""
         print("\nExpense Categories:")
-        for i, category in enumerate(self.expense_categories, 1):
-            print(f"{i}. {category}")
+        print(self._expense_menu)
         
         try:
             cat_choice = int(get_user_input("Select category (number): "))
@@ -441,11 +493,12 @@ class FinanceManager:
             print("Please enter a valid number!")
             return
         
-        amount = validate_amount(get_user_input(f"Enter monthly budget for {category}: $"))
+        amount = validate_amount_cli(get_user_input(f"Enter monthly budget for {category}: $"))
         if amount is None:
             return
         
         if self.db.set_budget(self.current_user_id, category, amount):
+            self._budget_cache = None
             print(f"Budget set for {category}: ${amount:.2f}/month")
         else:
             print("Failed to set budget!")
@@ -463,10 +516,11 @@ class FinanceManager:
         print("-" * 65)
         
         current_month = datetime.now().strftime("%Y-%m")
+        spending = self.db.get_monthly_spending_all(self.current_user_id, current_month)
         
         for budget in budgets:
-            category, budget_amount = budget[2], budget[3]
-            spent = self.db.get_monthly_spending(self.current_user_id, category, current_month)
+            category, budget_amount = budget["category"], budget["amount"]
+            spent = spending.get(category, 0.0)
             remaining = budget_amount - spent
             status = "Over Budget" if remaining < 0 else "On Track"
             
@@ -484,19 +538,20 @@ class FinanceManager:
         
         print("\nCurrent Budgets:")
         for i, budget in enumerate(budgets, 1):
-            print(f"{i}. {budget[2]}: ${budget[3]:.2f}")
+            print(f"{i}. {budget['category']}: ${budget['amount']:.2f}")
         
         try:
             choice = int(get_user_input("Select budget to update (number): "))
             if 1 <= choice <= len(budgets):
                 budget = budgets[choice - 1]
-                category = budget[2]
+                category = budget["category"]
                 
-                new_amount = validate_amount(get_user_input(f"Enter new budget amount for {category}: $"))
+                new_amount = validate_amount_cli(get_user_input(f"Enter new budget amount for {category}: $"))
                 if new_amount is None:
                     return
                 
-                if self.db.update_budget(budget[0], new_amount):
+                if self.db.update_budget(budget["id"], new_amount):
+                    self._budget_cache = None
                     print(f"Budget updated for {category}: ${new_amount:.2f}/month")
                 else:
                     print("Failed to update budget!")
@@ -515,17 +570,18 @@ class FinanceManager:
         
         print("\nCurrent Budgets:")
         for i, budget in enumerate(budgets, 1):
-            print(f"{i}. {budget[2]}: ${budget[3]:.2f}")
+            print(f"{i}. {budget['category']}: ${budget['amount']:.2f}")
         
         try:
             choice = int(get_user_input("Select budget to delete (number): "))
             if 1 <= choice <= len(budgets):
                 budget = budgets[choice - 1]
-                category = budget[2]
+                category = budget["category"]
                 
                 confirm = get_user_input(f"Delete budget for {category}? (y/N): ").lower()
                 if confirm == 'y':
-                    if self.db.delete_budget(budget[0]):
+                    if self.db.delete_budget(budget["id"]):
+                        self._budget_cache = None
                         print(f"Budget deleted for {category}")
                     else:
                         print("Failed to delete budget!")
@@ -536,30 +592,44 @@ class FinanceManager:
         except ValueError:
             print("Please enter a valid number!")
     
+    def _load_budget_cache(self):
+        """Load the current user's budgets and monthly spending into memory"""
+        budgets = self.db.get_user_budgets(self.current_user_id)
+        self._budget_cache = {budget["category"]: budget["amount"] for budget in budgets}
+        self._spend_cache = self.db.get_all_monthly_spending(self.current_user_id)
+    
+    def _record_spending(self, category: str, date_str: str, amount: float):
+        """Adjust cached monthly spending after an expense is written"""
+        if self._spend_cache is None:
+            return
+        
+        key = (category, date_str[:7])
+        self._spend_cache[key] = self._spend_cache.get(key, 0) + amount
+    
     def _check_budget_warning(self, category: str, amount: float, date_str: str):
         """Check if expense exceeds budget and warn user"""
-        try:
-            date_obj = datetime.strptime(date_str, "%Y-%m-%d")
-            month_year = date_obj.strftime("%Y-%m")
+        # date_str has already been validated as YYYY-MM-DD
+        month_year = date_str[:7]
+        
+        if self._budget_cache is None or self._spend_cache is None:
+            self._load_budget_cache()
+        
+        budget = self._budget_cache.get(category)
+        if budget:
+            current_spending = self._spend_cache.get((category, month_year), 0)
+            new_total = current_spending + amount
             
-            budget = self.db.get_category_budget(self.current_user_id, category)
-            if budget:
-                current_spending = self.db.get_monthly_spending(self.current_user_id, category, month_year)
-                new_total = current_spending + amount
+            if new_total > budget:
+                print(f"\n⚠️  WARNING: This expense will exceed your monthly budget for {category}!")
+                print(f"Budget: ${budget:.2f}")
+                print(f"Current spending: ${current_spending:.2f}")
+                print(f"New total: ${new_total:.2f}")
+                print(f"Over budget by: ${new_total - budget:.2f}")
                 
-                if new_total > budget:
-                    print(f"\n⚠️  WARNING: This expense will exceed your monthly budget for {category}!")
-                    print(f"Budget: ${budget:.2f}")
-                    print(f"Current spending: ${current_spending:.2f}")
-                    print(f"New total: ${new_total:.2f}")
-                    print(f"Over budget by: ${new_total - budget:.2f}")
-                    
-                    confirm = get_user_input("Do you want to continue? (y/N): ").lower()
-                    if confirm != 'y':
-                        print("Expense cancelled.")
-                        return False
-        except Exception as e:
-            pass  # Continue if budget check fails
+                confirm = get_user_input("Do you want to continue? (y/N): ").lower()
+                if confirm != 'y':
+                    print("Expense cancelled.")
+                    return False
         
         return True
     
@@ -574,8 +644,12 @@ class FinanceManager:
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
             filename = f"finance_backup_{self.current_user}_{timestamp}.json"
             
-            with open(filename, 'w') as f:
-                json.dump(backup_data, f, indent=2, default=str)
+            if orjson is not None:
+                with open(filename, 'wb') as f:
+                    f.write(orjson.dumps(backup_data, option=orjson.OPT_INDENT_2, default=str))
+            else:
+                with open(filename, 'w', encoding='utf-8') as f:
+                    json.dump(backup_data, f, indent=2, default=str, ensure_ascii=False)
             
             print(f"Data backed up successfully to: {filename}")
             
@@ -591,19 +665,26 @@ class FinanceManager:
         
         filename = get_user_input("Enter backup filename: ").strip()
         
-        if not os.path.exists(filename):
+        try:
+            with open(filename, 'rb') as f:
+                raw = f.read()
+        except FileNotFoundError:
             print("Backup file not found!")
             return
+        except OSError as e:
+            print(f"Restore failed: {e}")
+            return
         
         try:
-            with open(filename, 'r') as f:
-                backup_data = json.load(f)
+            backup_data = orjson.loads(raw) if orjson is not None else json.loads(raw)
             
             print("\n⚠️  WARNING: This will replace all your current data!")
             confirm = get_user_input("Are you sure you want to restore? (y/N): ").lower()
             
             if confirm == 'y':
                 if self.db.restore_user_data(self.current_user_id, backup_data):
+                    self._budget_cache = None
+                    self._spend_cache = None
                     print("Data restored successfully!")
                 else:
                     print("Restore failed!")
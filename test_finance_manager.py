@@ -3,67 +3,120 @@ Unit tests for Personal Finance Management Application
 """
 
 import unittest
+import io
 import os
 import tempfile
 import sqlite3
+import hashlib
+import json
+import uuid
+from unittest.mock import patch
 from datetime import datetime
-from database import DatabaseManager
+from database import USER_TRANSACTIONS_SQL, DatabaseManager
+import finance_manager
+import utils
 from finance_manager import FinanceManager
-from utils import validate_amount, validate_date, validate_username
+from utils import (validate_amount, validate_amount_cli, validate_date, validate_username,
+                   validate_password, clear_screen, format_currency, get_month_name,
+                   parse_month_year, truncate_string, hash_password, verify_password,
+                   password_needs_rehash)
 
 class TestDatabaseManager(unittest.TestCase):
-    def setUp(self):
-        """Set up test database"""
-        self.test_db = tempfile.NamedTemporaryFile(delete=False)
-        self.test_db.close()
-        self.db = DatabaseManager(self.test_db.name)
+    @classmethod
+    def setUpClass(cls):
+        """Set up a test database shared by every test in the class"""
+        cls.db = DatabaseManager(":memory:")
     
-    def tearDown(self):
+    @classmethod
+    def tearDownClass(cls):
         """Clean up test database"""
-        os.unlink(self.test_db.name)
+        cls.db.close()
+    
+    def setUp(self):
+        """Use a fresh username so tests sharing the database don't collide"""
+        self.username = f"user_{uuid.uuid4().hex[:12]}"
     
     def test_create_user(self):
         """Test user creation"""
-        result = self.db.create_user("testuser", "hashedpassword")
+        result = self.db.create_user(self.username, "hashedpassword")
         self.assertTrue(result)
         
         # Test duplicate username
-        result = self.db.create_user("testuser", "anotherpassword")
-        self.assertFalse(result)
-    
-    def test_authenticate_user(self):
-        """Test user authentication"""
-        self.db.create_user("testuser", "hashedpassword")
-        
-        # Valid credentials
-        user = self.db.authenticate_user("testuser", "hashedpassword")
-        self.assertIsNotNone(user)
-        self.assertEqual(user[1], "testuser")
-        
-        # Invalid credentials
-        user = self.db.authenticate_user("testuser", "wrongpassword")
-        self.assertIsNone(user)
+        result = self.db.create_user(self.username, "anotherpassword")
+        self.assertIs(result, False)
     
     def test_add_transaction(self):
         """Test adding transactions"""
-        self.db.create_user("testuser", "hashedpassword")
-        user = self.db.authenticate_user("testuser", "hashedpassword")
-        user_id = user[0]
+        user_id = self.db.create_user(self.username, "hashedpassword")
         
-        result = self.db.add_transaction(
+        trans_id = self.db.add_transaction(
             user_id, "income", 1000.0, "Salary", "Salary", "2024-01-01"
         )
-        self.assertTrue(result)
+        self.assertTrue(trans_id)
         
         transactions = self.db.get_user_transactions(user_id)
         self.assertEqual(len(transactions), 1)
+        self.assertEqual(transactions[0][0], trans_id)
         self.assertEqual(transactions[0][3], 1000.0)  # amount
+        self.assertEqual(transactions[0]["amount"], 1000.0)
+        self.assertEqual(transactions[0]["category"], "Salary")
+    
+    def test_transaction_pagination(self):
+        """Test paging through transactions newest first"""
+        user_id = self.db.create_user(self.username, "hashedpassword")
+        with self.db.bulk():
+            for day in ("2024-01-01", "2024-01-02", "2024-01-02", "2024-01-03", "2024-01-04"):
+                self.db.add_transaction(user_id, "expense", 10.0, "Lunch", "Food", day)
+        
+        all_ids = [row[0] for row in self.db.get_user_transactions(user_id)]
+        
+        pages = []
+        before_id = None
+        while True:
+            page = self.db.get_user_transactions(user_id, limit=2, before_id=before_id)
+            if not page:
+                break
+            pages.append([row[0] for row in page])
+            before_id = page[-1][0]
+        
+        self.assertEqual(len(pages), 3)
+        self.assertEqual([trans_id for page in pages for trans_id in page], all_ids)
+    
+    def test_transaction_iter_surfaces_later_errors(self):
+        """Test an error while streaming later batches is raised instead of ending the history early"""
+        db = DatabaseManager(":memory:")
+        user_id = db.create_user(self.username, "hashedpassword")
+        for day in ("2024-01-01", "2024-01-02", "2024-01-03"):
+            db.add_transaction(user_id, "expense", 10.0, "Lunch", "Food", day)
+        
+        rows = db.get_user_transactions_iter(user_id, batch=1)
+        self.assertEqual(next(rows)["date"], "2024-01-03")
+        db.close()
+        with self.assertRaises(sqlite3.Error):
+            next(rows)
+    
+    def test_bulk_transaction(self):
+        """Test bulk blocks commit together and roll back on errors"""
+        user_id = self.db.create_user(self.username, "hashedpassword")
+        
+        with self.db.bulk():
+            self.db.add_transaction(user_id, "income", 100.0, "Gift", "Gift", "2024-01-01")
+            self.db.set_budget(user_id, "Food", 200.0)
+        self.assertEqual(len(self.db.get_user_transactions(user_id)), 1)
+        
+        with self.assertRaises(RuntimeError):
+            with self.db.bulk():
+                self.db.add_transaction(user_id, "expense", 50.0, "Lunch", "Food", "2024-01-02")
+                self.assertEqual(self.db.get_monthly_report(user_id, 2024, 1)['total_expenses'], 50.0)
+                raise RuntimeError("abort")
+        
+        self.assertEqual(len(self.db.get_user_transactions(user_id)), 1)
+        self.assertEqual(self.db.get_monthly_report(user_id, 2024, 1)['total_expenses'], 0)
+        self.assertEqual(self.db.get_category_budget(user_id, "Food"), 200.0)
     
     def test_budget_operations(self):
         """Test budget operations"""
-        self.db.create_user("testuser", "hashedpassword")
-        user = self.db.authenticate_user("testuser", "hashedpassword")
-        user_id = user[0]
+        user_id = self.db.create_user(self.username, "hashedpassword")
         
         # Set budget
         result = self.db.set_budget(user_id, "Food", 500.0)
@@ -77,9 +130,7 @@ class TestDatabaseManager(unittest.TestCase):
     
     def test_monthly_report(self):
         """Test monthly report generation"""
-        self.db.create_user("testuser", "hashedpassword")
-        user = self.db.authenticate_user("testuser", "hashedpassword")
-        user_id = user[0]
+        user_id = self.db.create_user(self.username, "hashedpassword")
         
         # Add test transactions
         self.db.add_transaction(user_id, "income", 2000.0, "Salary", "Salary", "2024-01-15")
@@ -90,64 +141,544 @@ class TestDatabaseManager(unittest.TestCase):
         self.assertEqual(report['total_income'], 2000.0)
         self.assertEqual(report['total_expenses'], 500.0)
         self.assertEqual(report['net_savings'], 1500.0)
+    
+    def test_report_category_breakdowns(self):
+        """Test reports group totals by category and month"""
+        user_id = self.db.create_user(self.username, "hashedpassword")
+        
+        with self.db.bulk():
+            self.db.add_transaction(user_id, "income", 2000.0, "Salary", "Salary", "2024-01-15")
+            self.db.add_transaction(user_id, "income", 300.0, "Side job", "Freelance", "2024-02-03")
+            self.db.add_transaction(user_id, "expense", 200.0, "Groceries", "Food", "2024-01-10")
+            self.db.add_transaction(user_id, "expense", 50.0, "Takeout", "Food", "2024-01-22")
+            self.db.add_transaction(user_id, "expense", 800.0, "January rent", "Rent", "2024-01-01")
+        
+        monthly = self.db.get_monthly_report(user_id, 2024, 1)
+        self.assertEqual(monthly['income_by_category'], {"Salary": 2000.0})
+        self.assertEqual(monthly['expenses_by_category'], {"Food": 250.0, "Rent": 800.0})
+        
+        yearly = self.db.get_yearly_report(user_id, 2024)
+        self.assertEqual(len(yearly['monthly_summary']), 12)
+        self.assertEqual(yearly['monthly_summary'][0]['savings'], 950.0)
+        self.assertEqual(yearly['monthly_summary'][1]['income'], 300.0)
+        
+        summary = self.db.get_category_summary(user_id)
+        self.assertEqual(summary['income_categories'], {"Salary": 2000.0, "Freelance": 300.0})
+        self.assertEqual(summary['expense_categories'], {"Food": 250.0, "Rent": 800.0})
+    
+    def test_monthly_report_cache_invalidation(self):
+        """Test cached monthly reports are refreshed after transaction changes"""
+        user_id = self.db.create_user(self.username, "hashedpassword")
+        trans_id = self.db.add_transaction(user_id, "expense", 500.0, "Groceries", "Food", "2024-01-20")
+        
+        report = self.db.get_monthly_report(user_id, 2024, 1)
+        self.assertIs(self.db.get_monthly_report(user_id, 2024, 1), report)
+        
+        self.db.add_transaction(user_id, "expense", 50.0, "Taxi", "Transportation", "2024-01-21")
+        self.assertEqual(self.db.get_monthly_report(user_id, 2024, 1)['total_expenses'], 550.0)
+        
+        self.db.update_transaction(trans_id, 400.0, "Groceries", "Food", "2024-01-20")
+        self.assertEqual(self.db.get_monthly_report(user_id, 2024, 1)['total_expenses'], 450.0)
+        
+        self.db.delete_transaction(trans_id)
+        self.assertEqual(self.db.get_monthly_report(user_id, 2024, 1)['total_expenses'], 50.0)
+    
+    def test_report_month_boundaries(self):
+        """Test reports only include transactions inside the requested period"""
+        user_id = self.db.create_user(self.username, "hashedpassword")
+        
+        self.db.add_transaction(user_id, "expense", 10.0, "Before", "Food", "2023-11-30")
+        self.db.add_transaction(user_id, "expense", 20.0, "First day", "Food", "2023-12-01")
+        self.db.add_transaction(user_id, "expense", 30.0, "Last day", "Food", "2023-12-31")
+        self.db.add_transaction(user_id, "expense", 40.0, "After", "Food", "2024-01-01")
+        
+        report = self.db.get_monthly_report(user_id, 2023, 12)
+        self.assertEqual(report['total_expenses'], 50.0)
+        self.assertEqual(self.db.get_monthly_spending(user_id, "Food", "2023-12"), 50.0)
+        self.assertEqual(self.db.get_monthly_spending_all(user_id, "2023-12"), {"Food": 50.0})
+        
+        yearly = self.db.get_yearly_report(user_id, 2023)
+        self.assertEqual(yearly['total_expenses'], 60.0)
+    
+    def test_report_queries_use_date_index(self):
+        """Test report queries seek a date range on an index instead of scanning"""
+        user_id = self.db.create_user(self.username, "hashedpassword")
+        
+        statements = []
+        self.db._conn.set_trace_callback(statements.append)
+        self.db.get_monthly_report(user_id, 2024, 1)
+        self.db.get_yearly_report(user_id, 2024)
+        self.db.get_monthly_spending(user_id, "Food", "2024-01")
+        self.db.get_monthly_spending_all(user_id, "2024-01")
+        self.db._conn.set_trace_callback(None)
+        
+        self.assertEqual(len(statements), 4)
+        for sql in statements:
+            plan = " ".join(row[3] for row in self.db._conn.execute("EXPLAIN QUERY PLAN " + sql))
+            self.assertIn("USING INDEX", plan)
+            self.assertIn("date>? AND date<?", plan)
+    
+    def test_history_queries_skip_sorting(self):
+        """Test every history query variant reads the date index in order without a sort"""
+        for key, sql in USER_TRANSACTIONS_SQL.items():
+            with self.subTest(key=key):
+                params = [1] * sql.count("?")
+                plan = " ".join(row[3] for row in self.db._conn.execute("EXPLAIN QUERY PLAN " + sql, params))
+                self.assertIn("USING INDEX idx_tx_user_date", plan)
+                self.assertNotIn("TEMP B-TREE", plan)
+    
+    def test_spending_queries_use_category_index(self):
+        """Test budget spending lookups seek the (user, type, category, date) index"""
+        user_id = self.db.create_user(self.username, "hashedpassword")
+        
+        statements = []
+        self.db._conn.set_trace_callback(statements.append)
+        self.db.get_monthly_spending(user_id, "Food", "2024-01")
+        self.db.get_all_monthly_spending(user_id)
+        self.db._conn.set_trace_callback(None)
+        
+        self.assertEqual(len(statements), 2)
+        for sql in statements:
+            plan = " ".join(row[3] for row in self.db._conn.execute("EXPLAIN QUERY PLAN " + sql))
+            self.assertIn("USING INDEX idx_tx_user_type_cat_date", plan)
+    
+    def test_backup_and_restore(self):
+        """Test restoring a backup replaces the user's data"""
+        user_id = self.db.create_user(self.username, "hashedpassword")
+        
+        self.db.add_transaction(user_id, "income", 2000.0, "Salary", "Salary", "2024-01-15")
+        self.db.add_transaction(user_id, "expense", 500.0, "Groceries", "Food", "2024-01-20")
+        self.db.set_budget(user_id, "Food", 600.0)
+        backup = self.db.get_user_backup_data(user_id)
+        
+        self.db.add_transaction(user_id, "expense", 75.0, "Cinema", "Entertainment", "2024-01-25")
+        self.db.delete_budget(self.db.get_user_budgets(user_id)[0][0])
+        
+        self.assertTrue(self.db.restore_user_data(user_id, backup))
+        self.assertEqual(len(self.db.get_user_transactions(user_id)), 2)
+        self.assertEqual(self.db.get_category_budget(user_id, "Food"), 600.0)
+        self.assertEqual(self.db.get_monthly_report(user_id, 2024, 1)['total_expenses'], 500.0)
+    
+    def test_restore_rolls_back_unexpected_errors(self):
+        """Test a restore that fails on an unbindable value leaves no transaction open"""
+        user_id = self.db.create_user(self.username, "hashedpassword")
+        self.db.add_transaction(user_id, "expense", 50.0, "Lunch", "Food", "2024-01-10")
+        backup = {'transactions': [{'type': 'expense', 'amount': 10 ** 30, 'description': 'Huge',
+                                    'category': 'Food', 'date': '2024-01-11'}]}
+        
+        with self.assertRaises(OverflowError):
+            self.db.restore_user_data(user_id, backup)
+        self.assertFalse(self.db._conn.in_transaction)
+        self.assertEqual(len(self.db.get_user_transactions(user_id)), 1)
+    
+    def test_restore_spans_multiple_insert_chunks(self):
+        """Test restoring more rows than fit in a single multi-row INSERT"""
+        user_id = self.db.create_user(self.username, "hashedpassword")
+        backup = {
+            'transactions': [
+                {'type': 'expense', 'amount': float(i + 1), 'description': f"Item {i}",
+                 'category': 'Food', 'date': f"2024-01-{i % 28 + 1:02d}"}
+                for i in range(200)
+            ],
+            'budgets': [{'category': 'Food', 'amount': 100.0}, {'category': 'Food', 'amount': 250.0}]
+        }
+        
+        self.assertTrue(self.db.restore_user_data(user_id, backup))
+        self.assertEqual(len(self.db.get_user_transactions(user_id)), 200)
+        self.assertEqual(self.db.get_monthly_spending(user_id, "Food", "2024-01"), sum(range(1, 201)))
+        self.assertEqual(self.db.get_category_budget(user_id, "Food"), 250.0)
+    
+    def test_failed_restore_keeps_existing_data(self):
+        """Test a malformed backup leaves the current data untouched"""
+        user_id = self.db.create_user(self.username, "hashedpassword")
+        self.db.add_transaction(user_id, "expense", 500.0, "Groceries", "Food", "2024-01-20")
+        self.db.set_budget(user_id, "Food", 600.0)
+        
+        backup = {'transactions': [{'type': 'expense', 'amount': 10.0}], 'budgets': []}
+        self.assertFalse(self.db.restore_user_data(user_id, backup))
+        
+        self.assertEqual(len(self.db.get_user_transactions(user_id)), 1)
+        self.assertEqual(self.db.get_category_budget(user_id, "Food"), 600.0)
+
+class TestDatabaseFile(unittest.TestCase):
+    def setUp(self):
+        """Set up an on-disk test database"""
+        self.test_db = tempfile.NamedTemporaryFile(delete=False)
+        self.test_db.close()
+        self.addCleanup(os.unlink, self.test_db.name)
+    
+    def test_file_database_persists(self):
+        """Test file databases use WAL and keep data across connections"""
+        db = DatabaseManager(self.test_db.name)
+        self.assertEqual(db._conn.execute("PRAGMA journal_mode").fetchone()[0], "wal")
+        user_id = db.create_user("testuser", "hashedpassword")
+        db.add_transaction(user_id, "income", 100.0, "Gift", "Gift", "2024-01-01")
+        db.close()
+        
+        db = DatabaseManager(self.test_db.name)
+        self.assertEqual(len(db.get_user_transactions(user_id)), 1)
+        db.close()
+    
+    def test_legacy_dates_are_normalized(self):
+        """Test unpadded dates from older versions are fixed when the database opens"""
+        db = DatabaseManager(self.test_db.name)
+        user_id = db.create_user("testuser", "hashedpassword")
+        db._conn.executemany(
+            '''INSERT INTO transactions (user_id, type, amount, description, category, date)
+               VALUES (?, 'expense', ?, 'Legacy', 'Food', ?)''',
+            [(user_id, 10.0, "2024-1-5"), (user_id, 20.0, "2024-x")]
+        )
+        db._conn.execute("PRAGMA user_version = 0")
+        db.close()
+        
+        db = DatabaseManager(self.test_db.name)
+        self.addCleanup(db.close)
+        dates = sorted(row["date"] for row in db.get_user_transactions(user_id))
+        self.assertEqual(dates, ["2024-01-05", "2024-x"])
+        self.assertEqual(db.get_monthly_report(user_id, 2024, 1)['total_expenses'], 10.0)
+        self.assertEqual(db.get_monthly_report(user_id, 2024, 9)['total_expenses'], 0)
+        
+        # Dates SQLite can't parse are left out of the yearly summary
+        yearly = db.get_yearly_report(user_id, 2024)
+        self.assertEqual(yearly['total_expenses'], 10.0)
+        
+        # Restores only accept YYYY-MM-DD dates
+        backup = {'transactions': [{'type': 'expense', 'amount': 5.0, 'description': 'Old',
+                                    'category': 'Food', 'date': '2024-1-5'}]}
+        self.assertFalse(db.restore_user_data(user_id, backup))
+        self.assertEqual(len(db.get_user_transactions(user_id)), 2)
 
 class TestUtils(unittest.TestCase):
     def test_validate_amount(self):
         """Test amount validation"""
-        self.assertEqual(validate_amount("100"), 100.0)
-        self.assertEqual(validate_amount("100.50"), 100.5)
-        self.assertEqual(validate_amount("$100.50"), 100.5)
-        self.assertEqual(validate_amount("1,000.50"), 1000.5)
-        self.assertIsNone(validate_amount(""))
-        self.assertIsNone(validate_amount("abc"))
-        self.assertIsNone(validate_amount("-100"))
-        self.assertIsNone(validate_amount("0"))
+        cases = [
+            ("100", (100.0, None)),
+            ("100.50", (100.5, None)),
+            ("$100.50", (100.5, None)),
+            ("1,000.50", (1000.5, None)),
+            (" $ 25 \n", (25.0, None)),
+            ("", (None, "Amount cannot be empty!")),
+            ("abc", (None, "Invalid amount format! Please enter a valid number.")),
+            ("-100", (None, "Amount must be greater than 0!")),
+            ("0", (None, "Amount must be greater than 0!")),
+            ("1e10", (None, "Amount is too large!")),
+            ("$", (None, "Invalid amount format! Please enter a valid number.")),
+            ("nan", (None, "Invalid amount format! Please enter a valid number.")),
+            ("1.2.3", (None, "Invalid amount format! Please enter a valid number.")),
+        ]
+        for amount_str, expected in cases:
+            with self.subTest(amount_str=amount_str):
+                self.assertEqual(validate_amount(amount_str), expected)
+        
+        # The CLI wrapper prints the reason and returns just the amount
+        with patch("sys.stdout", new_callable=io.StringIO) as stdout:
+            self.assertIsNone(validate_amount_cli("abc"))
+        self.assertIn("Invalid amount format", stdout.getvalue())
+        self.assertEqual(validate_amount_cli("12.345"), 12.35)
     
     def test_validate_date(self):
         """Test date validation"""
-        self.assertTrue(validate_date("2024-01-01"))
-        self.assertTrue(validate_date("2024-12-31"))
-        self.assertFalse(validate_date("2024-13-01"))
-        self.assertFalse(validate_date("2024-01-32"))
-        self.assertFalse(validate_date("01-01-2024"))
-        self.assertFalse(validate_date(""))
-        self.assertFalse(validate_date("invalid"))
+        cases = [
+            ("2024-01-01", True),
+            ("2024-12-31", True),
+            ("2024-13-01", False),
+            ("2024-01-32", False),
+            ("01-01-2024", False),
+            ("", False),
+            ("invalid", False),
+            ("2024-02-29", True),  # leap year
+            ("2023-02-29", False),
+            ("2024-1-5", False),  # dates are stored zero-padded
+            ("2024-01-+1", False),
+            ("0000-01-01", False),
+        ]
+        for date_str, expected in cases:
+            with self.subTest(date_str=date_str):
+                self.assertEqual(validate_date(date_str), expected)
     
     def test_validate_username(self):
         """Test username validation"""
-        self.assertTrue(validate_username("user123"))
-        self.assertTrue(validate_username("test_user"))
-        self.assertTrue(validate_username("User"))
-        self.assertFalse(validate_username("us"))  # too short
-        self.assertFalse(validate_username(""))
-        self.assertFalse(validate_username("user@domain"))  # invalid chars
-        self.assertFalse(validate_username("a" * 21))  # too long
+        cases = [
+            ("user123", True),
+            ("test_user", True),
+            ("User", True),
+            ("us", False),  # too short
+            ("", False),
+            ("user@domain", False),  # invalid chars
+            ("a" * 21, False),  # too long
+            ("user_123\n", False),  # trailing newline
+            ("josé_123", False),  # ASCII only
+            ("user١٢٣", False),  # non-ASCII digits
+        ]
+        for username, expected in cases:
+            with self.subTest(username=username):
+                self.assertEqual(validate_username(username), expected)
+    
+    def test_validate_password(self):
+        """Test password strength validation"""
+        cases = [
+            ("secret123", True),
+            ("1234abcd", True),
+            ("abc12", False),  # too short
+            ("a1" * 26, False),  # too long
+            ("abcdefgh", False),  # no number
+            ("12345678", False),  # no letter
+        ]
+        for password, expected in cases:
+            with self.subTest(password=password):
+                self.assertEqual(validate_password(password)[0], expected)
+    
+    def test_clear_screen(self):
+        """Test clearing the screen writes ANSI codes instead of running clear"""
+        with patch("utils._CLEAR", utils._clear_with_ansi), \
+             patch("os.system") as system, \
+             patch("sys.stdout", new_callable=io.StringIO) as stdout:
+            clear_screen()
+        
+        self.assertEqual(stdout.getvalue(), "\x1b[2J\x1b[H")
+        system.assert_not_called()
+        
+        # Dumb terminals can't interpret escape codes
+        with patch("utils._CLEAR", utils._clear_with_command), \
+             patch("os.system") as system, \
+             patch("sys.stdout", new_callable=io.StringIO) as stdout:
+            clear_screen()
+        
+        self.assertEqual(stdout.getvalue(), "")
+        system.assert_called_once()
+    
+    def test_format_currency(self):
+        """Test currency formatting"""
+        self.assertEqual(format_currency(1234567.891), "$1,234,567.89")
+        self.assertEqual(format_currency(0), "$0.00")
+    
+    def test_truncate_string(self):
+        """Test truncating long strings with an ellipsis"""
+        cases = [
+            ("Groceries", 10, "Groceries"),
+            ("Groceries!", 10, "Groceries!"),
+            ("Weekly groceries", 10, "Weekly ..."),
+        ]
+        for text, max_length, expected in cases:
+            with self.subTest(text=text):
+                self.assertEqual(truncate_string(text, max_length), expected)
+    
+    def test_get_month_name(self):
+        """Test month names by number"""
+        self.assertEqual(get_month_name(1), "January")
+        self.assertEqual(get_month_name(12), "December")
+        self.assertEqual(get_month_name(0), "Unknown")
+        self.assertEqual(get_month_name(13), "Unknown")
+    
+    def test_parse_month_year(self):
+        """Test parsing YYYY-MM strings"""
+        cases = [
+            ("2024-01", (2024, 1)),
+            ("2024-12", (2024, 12)),
+            ("2024-13", None),
+            ("1899-01", None),
+            ("2024-1", None),
+            ("2024/01", None),
+            ("", None),
+            (None, None),
+        ]
+        for month_year, expected in cases:
+            with self.subTest(month_year=month_year):
+                self.assertEqual(parse_month_year(month_year), expected)
+    
+    def test_password_hashing(self):
+        """Test salted password hashing and verification"""
+        password_hash = hash_password("secret123", iterations=1000)
+        self.assertTrue(verify_password("secret123", password_hash))
+        self.assertFalse(verify_password("wrong123", password_hash))
+        
+        # Each hash gets its own salt
+        self.assertNotEqual(password_hash, hash_password("secret123", iterations=1000))
+        
+        # Legacy unsalted SHA-256 hashes still verify but need upgrading
+        legacy_hash = hashlib.sha256(b"secret123").hexdigest()
+        self.assertTrue(verify_password("secret123", legacy_hash))
+        self.assertFalse(verify_password("wrong123", legacy_hash))
+        
+        # Malformed hashes never verify
+        self.assertFalse(verify_password("secret123", "not-a-hex-digest"))
+        self.assertFalse(verify_password("secret123", "pbkdf2_sha256$1000$zz$zz"))
+        self.assertTrue(password_needs_rehash(legacy_hash))
+        self.assertTrue(password_needs_rehash(password_hash))  # below current work factor
+        self.assertFalse(password_needs_rehash(hash_password("secret123")))
 
 class TestFinanceManager(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        """Set up a test database shared by every test in the class"""
+        cls.db = DatabaseManager(":memory:")
+    
+    @classmethod
+    def tearDownClass(cls):
+        """Clean up test database"""
+        cls.db.close()
+    
     def setUp(self):
         """Set up test environment"""
-        self.test_db = tempfile.NamedTemporaryFile(delete=False)
-        self.test_db.close()
+        # Create finance manager with the shared test database
+        with patch("finance_manager.DatabaseManager", return_value=self.db):
+            self.finance_manager = FinanceManager()
         
-        # Create finance manager with test database
-        self.finance_manager = FinanceManager()
-        self.finance_manager.db = DatabaseManager(self.test_db.name)
-        
-        # Create test user
-        self.finance_manager.db.create_user("testuser", "hashedpassword")
-        user = self.finance_manager.db.authenticate_user("testuser", "hashedpassword")
-        self.finance_manager.current_user = "testuser"
-        self.finance_manager.current_user_id = user[0]
-    
-    def tearDown(self):
-        """Clean up test environment"""
-        os.unlink(self.test_db.name)
+        # Create a test user unique to this test
+        username = f"user_{uuid.uuid4().hex[:12]}"
+        self.finance_manager.current_user = username
+        self.finance_manager.current_user_id = self.finance_manager.db.create_user(username, "hashedpassword")
     
     def test_categories(self):
         """Test predefined categories"""
         self.assertIn("Salary", self.finance_manager.income_categories)
         self.assertIn("Food", self.finance_manager.expense_categories)
         self.assertIn("Rent", self.finance_manager.expense_categories)
+        
+        # Menus list every category, numbered from 1
+        self.assertEqual(self.finance_manager._income_menu.splitlines()[0], "1. Salary")
+        self.assertEqual(self.finance_manager._expense_menu.splitlines()[-1],
+                         f"{len(self.finance_manager.expense_categories)}. Other")
+    
+    @patch("finance_manager.clear_screen")
+    def test_register_duplicate_username(self, _clear_screen):
+        """Test registering a taken username leaves the existing account alone"""
+        username = self.finance_manager.current_user
+        with patch("finance_manager.get_user_input", return_value=username), \
+             patch("getpass.getpass", return_value="secret123"), \
+             patch("sys.stdout", new_callable=io.StringIO) as stdout:
+            self.finance_manager.register()
+        
+        self.assertIn("Username already exists!", stdout.getvalue())
+        self.assertEqual(self.finance_manager.db.get_user(username)["password_hash"], "hashedpassword")
+    
+    @patch("finance_manager.clear_screen")
+    def test_login_upgrades_legacy_hash(self, _clear_screen):
+        """Test logging in with a legacy SHA-256 hash rehashes the password"""
+        legacy_hash = hashlib.sha256(b"secret123").hexdigest()
+        username = f"legacy_{uuid.uuid4().hex[:12]}"
+        user_id = self.finance_manager.db.create_user(username, legacy_hash)
+        
+        with patch("finance_manager.get_user_input", return_value=username), \
+             patch("getpass.getpass", return_value="secret123"):
+            self.finance_manager.login()
+        
+        self.assertEqual(self.finance_manager.current_user_id, user_id)
+        stored_hash = self.finance_manager.db.get_user(username)[2]
+        self.assertTrue(stored_hash.startswith("pbkdf2_sha256$"))
+        self.assertTrue(verify_password("secret123", stored_hash))
+    
+    @patch("finance_manager.clear_screen")
+    def test_login_unknown_user_still_derives_key(self, _clear_screen):
+        """Test an unknown username is checked against a dummy hash so timing doesn't reveal it"""
+        username = f"missing_{uuid.uuid4().hex[:12]}"
+        user_id = self.finance_manager.current_user_id
+        
+        with patch("finance_manager.get_user_input", return_value=username), \
+             patch("getpass.getpass", return_value="secret123"), \
+             patch("finance_manager.verify_password", wraps=verify_password) as verify:
+            self.finance_manager.login()
+        
+        verify.assert_called_once_with("secret123", finance_manager._DUMMY_PASSWORD_HASH)
+        self.assertEqual(self.finance_manager.current_user_id, user_id)
+    
+    @patch("builtins.input", return_value="")
+    @patch("finance_manager.clear_screen")
+    def test_backup_file_round_trip(self, _clear_screen, _input):
+        """Test backup files are identical and restore with and without orjson installed"""
+        fm = self.finance_manager
+        fm.db.add_transaction(fm.current_user_id, "expense", 42.5, "Café books", "Education", "2024-03-02")
+        fm.db.set_budget(fm.current_user_id, "Education", 100.0)
+        backup = fm.db.get_user_backup_data(fm.current_user_id)
+        expected = {key: backup[key] for key in ('transactions', 'budgets')}
+        
+        contents = []
+        cwd = os.getcwd()
+        for json_module in (finance_manager.orjson, None):
+            with self.subTest(orjson=json_module is not None), \
+                 tempfile.TemporaryDirectory() as backup_dir, \
+                 patch("finance_manager.orjson", json_module):
+                os.chdir(backup_dir)
+                try:
+                    with patch.object(fm.db, "get_user_backup_data", return_value=backup):
+                        fm.backup_data()
+                    filename = os.listdir(backup_dir)[0]
+                    with open(filename, 'rb') as f:
+                        contents.append(f.read())
+                    written = json.loads(contents[-1])
+                    self.assertEqual(written['transactions'], expected['transactions'])
+                    self.assertEqual(written['budgets'], expected['budgets'])
+                    
+                    with patch("finance_manager.get_user_input", side_effect=[filename, "y"]):
+                        fm.restore_data()
+                finally:
+                    os.chdir(cwd)
+                restored = fm.db.get_user_backup_data(fm.current_user_id)
+                self.assertEqual(restored['transactions'], expected['transactions'])
+                self.assertEqual(restored['budgets'], expected['budgets'])
+        
+        # Both writers emit UTF-8 text rather than \u escapes
+        self.assertEqual(contents[0], contents[1])
+        self.assertIn("Café".encode(), contents[0])
+    
+    @patch("builtins.input")
+    @patch("finance_manager.clear_screen")
+    def test_restore_data_missing_file(self, _clear_screen, _input):
+        """Test restoring from a missing file reports it and changes nothing"""
+        fm = self.finance_manager
+        fm.db.add_transaction(fm.current_user_id, "income", 50.0, "Gift", "Gift", "2024-01-01")
+        missing = os.path.join(tempfile.gettempdir(), "no_such_finance_backup.json")
+        
+        with patch("finance_manager.get_user_input", return_value=missing), \
+             patch("sys.stdout", new_callable=io.StringIO) as stdout:
+            fm.restore_data()
+        
+        self.assertIn("Backup file not found!", stdout.getvalue())
+        self.assertEqual(len(fm.db.get_user_transactions(fm.current_user_id)), 1)
+        _input.assert_not_called()
+    
+    @patch("builtins.input", return_value="")
+    @patch("finance_manager.clear_screen")
+    def test_restore_data_directory_path(self, _clear_screen, _input):
+        """Test restoring from a path that can't be read reports it instead of crashing"""
+        fm = self.finance_manager
+        fm.db.add_transaction(fm.current_user_id, "income", 50.0, "Gift", "Gift", "2024-01-01")
+        
+        with tempfile.TemporaryDirectory() as backup_dir, \
+             patch("finance_manager.get_user_input", return_value=backup_dir), \
+             patch("sys.stdout", new_callable=io.StringIO) as stdout:
+            fm.restore_data()
+        
+        self.assertIn("Restore failed:", stdout.getvalue())
+        self.assertEqual(len(fm.db.get_user_transactions(fm.current_user_id)), 1)
+    
+    @patch("builtins.input", return_value="")
+    @patch("finance_manager.clear_screen")
+    def test_restore_data_rolls_back_bad_backup(self, _clear_screen, _input):
+        """Test restoring a backup with a bad row leaves current data intact"""
+        db = self.finance_manager.db
+        user_id = self.finance_manager.current_user_id
+        db.add_transaction(user_id, "expense", 120.0, "Groceries", "Food", "2024-01-15")
+        
+        backup = {
+            'transactions': [
+                {'type': 'income', 'amount': 100.0, 'description': 'Gift',
+                 'category': 'Gift', 'date': '2024-01-01'},
+                {'type': 'refund', 'amount': 5.0, 'description': 'Invalid type',
+                 'category': 'Other', 'date': '2024-01-02'}
+            ],
+            'budgets': []
+        }
+        with tempfile.NamedTemporaryFile('w', suffix='.json', delete=False) as f:
+            json.dump(backup, f)
+        self.addCleanup(os.unlink, f.name)
+        
+        with patch("finance_manager.get_user_input", side_effect=[f.name, "y"]):
+            self.finance_manager.restore_data()
+        
+        transactions = db.get_user_transactions(user_id)
+        self.assertEqual(len(transactions), 1)
+        self.assertEqual(transactions[0][4], "Groceries")
     
     def test_budget_warning_check(self):
         """Test budget warning functionality"""
@@ -165,6 +696,78 @@ class TestFinanceManager(unittest.TestCase):
         # This should trigger a warning (300 + 300 > 500)
         result = self.finance_manager._check_budget_warning("Food", 300.0, "2024-01-20")
         # Note: This test would need user input simulation for full testing
+    
+    @patch("builtins.input", return_value="")
+    @patch("finance_manager.clear_screen")
+    def test_view_transactions_output(self, _clear_screen, _input):
+        """Test transaction history rows are formatted in one buffered write"""
+        fm = self.finance_manager
+        expense_id = fm.db.add_transaction(fm.current_user_id, "expense", 12.5, "Lunch at the corner cafe", "Food", "2024-01-15")
+        income_id = fm.db.add_transaction(fm.current_user_id, "income", 1000.0, "Paycheck", "Salary", "2024-01-31")
+        
+        with patch("sys.stdout", new_callable=io.StringIO) as stdout:
+            fm.view_transactions()
+        
+        lines = stdout.getvalue().splitlines()
+        self.assertEqual(lines[-1].split(), [str(expense_id), "expense", "$12.50", "Food", "Lunch", "at", "the", "corne", "2024-01-15"])
+        self.assertEqual(lines[-2].split(), [str(income_id), "income", "$1000.00", "Salary", "Paycheck", "2024-01-31"])
+        self.assertEqual(lines[-1].index("Food"), 28)
+    
+    @patch("builtins.input", return_value="")
+    def test_report_output(self, _input):
+        """Test monthly and yearly reports print totals and breakdowns"""
+        fm = self.finance_manager
+        fm.db.add_transaction(fm.current_user_id, "income", 2000.0, "Salary", "Salary", "2024-01-15")
+        fm.db.add_transaction(fm.current_user_id, "expense", 500.0, "Groceries", "Food", "2024-01-20")
+        
+        with patch("finance_manager.get_user_input", return_value="2024-01"), \
+             patch("sys.stdout", new_callable=io.StringIO) as stdout:
+            fm._generate_monthly_report()
+        self.assertEqual(stdout.getvalue(),
+                         "\n=== Monthly Report for 2024-01 ===\n"
+                         "Total Income: $2000.00\nTotal Expenses: $500.00\nNet Savings: $1500.00\n"
+                         "\nIncome by Category:\n  Salary: $2000.00\n"
+                         "\nExpenses by Category:\n  Food: $500.00\n")
+        
+        with patch("finance_manager.get_user_input", return_value="2024"), \
+             patch("sys.stdout", new_callable=io.StringIO) as stdout:
+            fm._generate_yearly_report()
+        lines = stdout.getvalue().splitlines()
+        self.assertEqual(lines[1], "=== Yearly Report for 2024 ===")
+        self.assertEqual(lines[7], "  January: Income $2000.00, Expenses $500.00, Savings $1500.00")
+        self.assertEqual(len(lines), 19)
+    
+    @patch("finance_manager.clear_screen")
+    def test_expense_budget_cache(self, _clear_screen):
+        """Test budget checks read cached spending and expenses keep it in step with the database"""
+        fm = self.finance_manager
+        fm.db.set_budget(fm.current_user_id, "Food", 500.0)
+        fm.db.add_transaction(fm.current_user_id, "expense", 300.0, "Groceries", "Food", "2024-01-15")
+        fm._load_budget_cache()
+        
+        with patch("finance_manager.get_user_input",
+                   side_effect=["300", "Dinner", "1", "2024-01-20", "y"]), \
+             patch.object(fm.db, "get_monthly_spending") as get_monthly_spending:
+            fm.add_expense()
+        get_monthly_spending.assert_not_called()
+        self.assertEqual(len(fm.db.get_user_transactions(fm.current_user_id)), 2)
+        self.assertEqual(fm._spend_cache[("Food", "2024-01")], 600.0)
+        self.assertEqual(fm._spend_cache,
+                         fm.db.get_all_monthly_spending(fm.current_user_id))
+    
+    @patch("finance_manager.clear_screen")
+    def test_declined_budget_warning_cancels_expense(self, _clear_screen):
+        """Test declining the over-budget warning doesn't save the expense"""
+        fm = self.finance_manager
+        fm.db.set_budget(fm.current_user_id, "Food", 500.0)
+        fm.db.add_transaction(fm.current_user_id, "expense", 300.0, "Groceries", "Food", "2024-01-15")
+        
+        with patch("finance_manager.get_user_input",
+                   side_effect=["300", "Dinner", "1", "2024-01-20", "n"]), \
+             patch("sys.stdout", new_callable=io.StringIO) as stdout:
+            fm.add_expense()
+        self.assertIn("Expense cancelled.", stdout.getvalue())
+        self.assertEqual(len(fm.db.get_user_transactions(fm.current_user_id)), 1)
 
 if __name__ == '__main__':
     # Create test suite
@@ -172,6 +775,7 @@ if __name__ == '__main__':
     
     # Add test cases
     test_suite.addTest(unittest.makeSuite(TestDatabaseManager))
+    test_suite.addTest(unittest.makeSuite(TestDatabaseFile))
     test_suite.addTest(unittest.makeSuite(TestUtils))
     test_suite.addTest(unittest.makeSuite(TestFinanceManager))
     
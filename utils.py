@@ -2,14 +2,52 @@
 Utility functions for Personal Finance Application
 """
 
+import calendar
+import hashlib
+import hmac
 import os
-import re
+import string
+import sys
 from datetime import datetime
 from typing import Optional, Tuple
 
+# PBKDF2 work factor for new password hashes. Raise it as hardware gets
+# faster; stored hashes keep their own count and are upgraded on login.
+PASSWORD_HASH_ITERATIONS = 600000
+
+# Characters allowed in usernames: ASCII letters, digits and underscores
+_USERNAME_CHARS = frozenset(string.ascii_letters + string.digits + '_')
+
+_MONTHS = (
+    "January", "February", "March", "April", "May", "June",
+    "July", "August", "September", "October", "November", "December"
+)
+
+_DIGITS = frozenset(string.digits)
+
+# Bound once so format_currency skips the method lookup on every call
+_CURRENCY_FMT = "${:,.2f}".format
+
+# Windows consoles only honour ANSI escape codes once VT processing is on;
+# running an empty command through the shell switches it on for this console
+if os.name == 'nt':
+    os.system('')
+
+def _clear_with_ansi():
+    """Erase the screen and home the cursor without spawning a process"""
+    sys.stdout.write("\x1b[2J\x1b[H")
+    sys.stdout.flush()
+
+def _clear_with_command():
+    """Clear the screen with the system clear command"""
+    os.system('cls' if os.name == 'nt' else 'clear')
+
+# Pick the clearing method once; dumb terminals can't interpret escape codes
+_CLEAR = _clear_with_command if os.environ.get('TERM') == 'dumb' else _clear_with_ansi
+
 def clear_screen():
     """Clear the terminal screen"""
-    os.system('cls' if os.name == 'nt' else 'clear')
+    _CLEAR()
 
 def print_header(title: str):
     """Print formatted header"""
@@ -27,59 +65,68 @@ def get_user_input(prompt: str) -> str:
     except EOFError:
         return ""
 
-def validate_amount(amount_str: str) -> Optional[float]:
-    """Validate and convert amount string to float"""
+def validate_amount(amount_str: str) -> Tuple[Optional[float], Optional[str]]:
+    """Validate and convert amount string to float, returning (amount, error)"""
     if not amount_str:
-        print("Amount cannot be empty!")
-        return None
+        return None, "Amount cannot be empty!"
     
-    # Remove dollar sign and spaces
-    amount_str = amount_str.replace('$', '').replace(',', '').strip()
+    # Remove dollar sign and thousands separators only when present;
+    # float() already ignores surrounding whitespace
+    if '$' in amount_str or ',' in amount_str:
+        amount_str = amount_str.replace('$', '').replace(',', '')
+    
+    # Anything without a digit can't be an amount, so skip float() and its
+    # exception; this also turns away "nan" and "inf"
+    if _DIGITS.isdisjoint(amount_str):
+        return None, "Invalid amount format! Please enter a valid number."
     
     try:
         amount = float(amount_str)
-        if amount <= 0:
-            print("Amount must be greater than 0!")
-            return None
-        if amount > 999999999:
-            print("Amount is too large!")
-            return None
-        return round(amount, 2)
     except ValueError:
-        print("Invalid amount format! Please enter a valid number.")
-        return None
+        return None, "Invalid amount format! Please enter a valid number."
+    
+    if amount <= 0:
+        return None, "Amount must be greater than 0!"
+    if amount > 999999999:
+        return None, "Amount is too large!"
+    return round(amount, 2), None
+
+def validate_amount_cli(amount_str: str) -> Optional[float]:
+    """Validate amount string, printing the reason if it is invalid"""
+    amount, error = validate_amount(amount_str)
+    if error:
+        print(error)
+    return amount
 
 def validate_date(date_str: str) -> bool:
     """Validate date string in YYYY-MM-DD format"""
-    if not date_str:
+    if not date_str or len(date_str) != 10 or date_str[4] != '-' or date_str[7] != '-':
         return False
     
-    try:
-        datetime.strptime(date_str, "%Y-%m-%d")
-        return True
-    except ValueError:
+    digits = date_str[:4] + date_str[5:7] + date_str[8:]
+    if not (digits.isascii() and digits.isdigit()):
+        return False
+    
+    year, month, day = int(date_str[:4]), int(date_str[5:7]), int(date_str[8:])
+    if year < 1 or not 1 <= month <= 12:
         return False
+    return 1 <= day <= calendar.monthrange(year, month)[1]
 
 def format_currency(amount: float) -> str:
     """Format amount as currency"""
-    return f"${amount:,.2f}"
+    return _CURRENCY_FMT(amount)
 
 def get_month_name(month: int) -> str:
     """Get month name from month number"""
-    months = [
-        "January", "February", "March", "April", "May", "June",
-        "July", "August", "September", "October", "November", "December"
-    ]
-    return months[month - 1] if 1 <= month <= 12 else "Unknown"
+    return _MONTHS[month - 1] if 1 <= month <= 12 else "Unknown"
 
 def validate_username(username: str) -> bool:
-    """Validate username format"""
+    """Validate username format; only ASCII letters, digits and underscores are allowed"""
     if not username:
         return False
     
     # Username should be 3-20 characters, alphanumeric and underscores only
-    pattern = r'^[a-zA-Z0-9_]{3,20}$'
-    return bool(re.match(pattern, username))
+    return 3 <= len(username) <= 20 and _USERNAME_CHARS.issuperset(username)
 
 def validate_password(password: str) -> Tuple[bool, str]:
     """Validate password strength"""
@@ -89,20 +136,58 @@ def validate_password(password: str) -> Tuple[bool, str]:
     if len(password) > 50:
         return False, "Password must be less than 50 characters"
     
-    # Check for at least one letter and one number
-    has_letter = any(c.isalpha() for c in password)
-    has_number = any(c.isdigit() for c in password)
+    # Check for at least one letter and one number in a single pass
+    has_letter = has_number = False
+    for c in password:
+        if c.isalpha():
+            has_letter = True
+        elif c.isdigit():
+            has_number = True
+        if has_letter and has_number:
+            break
     
     if not (has_letter and has_number):
         return False, "Password must contain at least one letter and one number"
     
     return True, "Password is valid"
 
+def hash_password(password: str, iterations: int = PASSWORD_HASH_ITERATIONS) -> str:
+    """Hash password with a random salt using PBKDF2-HMAC-SHA256"""
+    salt = os.urandom(16)
+    digest = hashlib.pbkdf2_hmac('sha256', password.encode(), salt, iterations)
+    return f"pbkdf2_sha256${iterations}${salt.hex()}${digest.hex()}"
+
+def verify_password(password: str, password_hash: str) -> bool:
+    """Check password against a stored hash in constant time"""
+    # Digests are compared as raw bytes, so the candidate is never hex-encoded
+    try:
+        if '$' not in password_hash:
+            # Legacy unsalted SHA-256 hex digest
+            candidate = hashlib.sha256(password.encode()).digest()
+            return hmac.compare_digest(candidate, bytes.fromhex(password_hash))
+        
+        algorithm, iterations, salt, digest = password_hash.split('$')
+        if algorithm != 'pbkdf2_sha256':
+            return False
+        candidate = hashlib.pbkdf2_hmac('sha256', password.encode(),
+                                        bytes.fromhex(salt), int(iterations))
+        return hmac.compare_digest(candidate, bytes.fromhex(digest))
+    except ValueError:
+        return False
+
+def password_needs_rehash(password_hash: str) -> bool:
+    """Check if a stored hash is legacy or weaker than the current work factor"""
+    parts = password_hash.split('$')
+    if len(parts) != 4 or parts[0] != 'pbkdf2_sha256':
+        return True
+    try:
+        return int(parts[1]) < PASSWORD_HASH_ITERATIONS
+    except ValueError:
+        return True
+
 def truncate_string(text: str, max_length: int) -> str:
     """Truncate string to max length with ellipsis"""
-    if len(text) <= max_length:
-        return text
-    return text[:max_length - 3] + "..."
+    return text if len(text) <= max_length else f"{text[:max_length - 3]}..."
 
 def get_current_month_year() -> str:
     """Get current month and year in YYYY-MM format"""
@@ -114,10 +199,14 @@ def get_current_year() -> int:
 
 def parse_month_year(month_year_str: str) -> Optional[Tuple[int, int]]:
     """Parse month-year string and return (year, month) tuple"""
-    try:
-        year, month = map(int, month_year_str.split('-'))
-        if 1 <= month <= 12 and 1900 <= year <= 2100:
-            return year, month
+    if not month_year_str or len(month_year_str) != 7 or month_year_str[4] != '-':
+        return None
+    
+    digits = month_year_str[:4] + month_year_str[5:]
+    if not (digits.isascii() and digits.isdigit()):
         return None
-    except (ValueError, AttributeError):
-        return None
\ No newline at end of file
+    
+    year, month = int(month_year_str[:4]), int(month_year_str[5:])
+    if 1 <= month <= 12 and 1900 <= year <= 2100:
+        return year, month
+    return None
\ No newline at end of file